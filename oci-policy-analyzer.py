@@ -7,16 +7,61 @@ Supports both Legacy IAM (full OCIDs) and Identity Domain users (short IDs).
 
 import oci
 import sys
+import os
 import re
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from oci._vendor.requests.adapters import HTTPAdapter
+from oci.pagination import list_call_get_all_results
 from typing import List, Dict, Set, Optional, Tuple
-from collections import defaultdict
+
+# Policy fetches are network-bound, so size the pool for I/O rather than CPU count
+MAX_WORKERS = 32
+# Smaller pool for per-user group lookups, which rarely exceed a few dozen groups
+GROUP_WORKERS = 16
+# Largest page size accepted by the IAM list calls and the Identity Domains SCIM API
+PAGE_LIMIT = 1000
+# Keep-alive connections per client; wide enough that worker threads never wait on the pool
+CONNECTION_POOL_SIZE = 64
+# Identity domain listings persisted between runs, keyed by tenancy OCID
+CACHE_FILE = os.path.expanduser("~/.oci/policy_analyzer_cache.json")
+CACHE_TTL_SECONDS = 24 * 60 * 60
+
+log = logging.getLogger("oci_policy")
+
+# Pattern to match compartment OCIDs in policy statements
+_COMPARTMENT_RE = re.compile(r'compartment\s+(ocid1\.compartment\.[a-zA-Z0-9\._-]+)', re.IGNORECASE)
+# Identity Domain user IDs are 32 hex characters
+_DOMAIN_USER_ID_RE = re.compile(r'[0-9a-fA-F]{32}')
+
+
+def widen_connection_pool(client):
+    """Grow the client's HTTPS keep-alive pool beyond the default 10 connections."""
+    # The SDK's session uses stock adapters, so a larger one from its vendored requests replaces it
+    adapter = HTTPAdapter(pool_connections=CONNECTION_POOL_SIZE, pool_maxsize=CONNECTION_POOL_SIZE)
+    client.base_client.session.mount('https://', adapter)
+    return client
+
+
+@lru_cache(maxsize=None)
+def compile_group_pattern(group_names: frozenset):
+    """Build one pattern matching "group GroupName" or "group 'GroupName'" for any of the lowercased names."""
+    # Longest names first so the alternation prefers the most specific group
+    escaped_names = '|'.join(re.escape(name) for name in sorted(group_names, key=lambda n: (-len(n), n)))
+    # The lookahead stops "group admins" from matching a statement for "group administrators"
+    return re.compile(rf"group\s+['\"]?({escaped_names})(?=['\"\s,)]|$)", re.IGNORECASE)
+
 
 class OCIPolicyAnalyzer:
     def __init__(self, config_file="~/.oci/config", profile="DEFAULT"):
         """Initialize OCI clients with config file authentication."""
         try:
             self.config = oci.config.from_file(config_file, profile)
-            self.identity_client = oci.identity.IdentityClient(self.config)
+            self.identity_client = widen_connection_pool(oci.identity.IdentityClient(self.config))
             
             # Get tenancy info
             self.tenancy_id = self.config["tenancy"]
@@ -24,13 +69,69 @@ class OCIPolicyAnalyzer:
             
             # Cache for compartment names to avoid repeated API calls
             self.compartment_cache = {}
-            # Cache for identity domains
+            self._compartment_cache_lock = threading.Lock()
+            # Translated statements, since identical statements recur across policies
+            self._translate_cache = {}
+            # Cache for identity domains and active compartments
             self.domains_cache = None
+            self.compartments_cache = None
+            # One Identity Domains client per domain URL, reused across lookups
+            self._domain_clients = {}
+            self._domain_clients_lock = threading.Lock()
+            
+            # Reuse the domain listing from a recent run unless OCI_POLICY_NO_CACHE is set
+            self._domains_from_cache = False
+            if not os.environ.get("OCI_POLICY_NO_CACHE"):
+                self._load_cache()
             
         except Exception as e:
             print(f"Error initializing OCI clients: {e}")
             sys.exit(1)
     
+    def _load_cache(self):
+        """Load the domain listing saved by a previous run, if still fresh."""
+        try:
+            with open(CACHE_FILE, encoding="utf-8") as cache_file:
+                entry = json.load(cache_file).get(self.tenancy_id)
+            if not entry or time.time() - entry["domains_ts"] >= CACHE_TTL_SECONDS:
+                return
+            domains = [oci.identity.models.Domain(**domain) for domain in entry["domains"]]
+        except (OSError, ValueError, KeyError, TypeError):
+            # Missing, stale-format or unreadable cache - domains are fetched from the API instead
+            return
+        
+        self.domains_cache = domains
+        self._domains_from_cache = True
+        print(f"Using cached domains from {CACHE_FILE}")
+    
+    def save_cache(self):
+        """Persist the domain listing fetched by this run for later runs against this tenancy."""
+        if self.domains_cache is None or self._domains_from_cache:
+            return
+        
+        try:
+            with open(CACHE_FILE, encoding="utf-8") as cache_file:
+                cache = json.load(cache_file)
+        except (OSError, ValueError):
+            cache = {}
+        
+        cache[self.tenancy_id] = {
+            'domains': [
+                {'id': d.id, 'display_name': d.display_name, 'url': d.url, 'lifecycle_state': d.lifecycle_state}
+                for d in self.domains_cache
+            ],
+            'domains_ts': time.time()
+        }
+        
+        try:
+            # Write to a temporary file first so a crash never leaves a half-written cache
+            tmp_file = f"{CACHE_FILE}.tmp"
+            with open(tmp_file, "w", encoding="utf-8") as cache_file:
+                json.dump(cache, cache_file)
+            os.replace(tmp_file, CACHE_FILE)
+        except OSError as e:
+            print(f"Warning: Could not save cache to {CACHE_FILE}: {e}")
+    
     def get_identity_domains(self) -> List[oci.identity.models.Domain]:
         """Get all identity domains in the tenancy."""
         if self.domains_cache is not None:
@@ -38,7 +139,11 @@ class OCIPolicyAnalyzer:
         
         try:
             print("Fetching identity domains...")
-            response = self.identity_client.list_domains(compartment_id=self.tenancy_id)
+            response = list_call_get_all_results(
+                self.identity_client.list_domains,
+                compartment_id=self.tenancy_id,
+                limit=PAGE_LIMIT
+            )
             active_domains = [d for d in response.data if d.lifecycle_state == 'ACTIVE']
             print(f"Found {len(active_domains)} active identity domains")
             self.domains_cache = active_domains
@@ -47,6 +152,27 @@ class OCIPolicyAnalyzer:
             print(f"Error fetching identity domains: {e}")
             return []
     
+    def _get_domain_client(self, domain_url: str) -> oci.identity_domains.IdentityDomainsClient:
+        """Get the Identity Domains client for a domain URL, creating it on first use."""
+        with self._domain_clients_lock:
+            domain_client = self._domain_clients.get(domain_url)
+            if domain_client is None:
+                domain_client = widen_connection_pool(oci.identity_domains.IdentityDomainsClient(
+                    config=self.config,
+                    service_endpoint=domain_url
+                ))
+                self._domain_clients[domain_url] = domain_client
+            return domain_client
+    
+    def _user_exists_in_domain(self, user_id: str, domain) -> bool:
+        """Check whether a user exists in the given identity domain."""
+        try:
+            user_response = self._get_domain_client(domain.url).get_user(user_id=user_id)
+            return bool(user_response.data)
+        except Exception:
+            # User not found in this domain
+            return False
+    
     def detect_user_id_type(self, user_id: str) -> Tuple[str, Optional[str]]:
         """
         Detect if user_id is a Legacy IAM OCID or Identity Domain user ID.
@@ -55,30 +181,51 @@ class OCIPolicyAnalyzer:
         if user_id.startswith("ocid1.user."):
             return ("legacy", None)
         
+        if not _DOMAIN_USER_ID_RE.fullmatch(user_id):
+            raise ValueError(f"User ID '{user_id}' is neither a Legacy IAM user OCID nor an Identity Domain user ID")
+        
+        # Skip domain discovery when the caller already knows the user's domain
+        domain_url = os.environ.get("OCI_POLICY_DOMAIN_URL")
+        if domain_url:
+            print(f"Using identity domain from OCI_POLICY_DOMAIN_URL: {domain_url}")
+            return ("identity_domain", domain_url)
+        
         # For Identity Domain users, we need to find which domain they belong to
-        # This requires checking each domain
         domains = self.get_identity_domains()
+        domain = self._find_user_domain(user_id, domains)
         
-        for domain in domains:
-            try:
-                # Try to create a client for this domain and check if user exists
-                domain_client = oci.identity_domains.IdentityDomainsClient(
-                    config=self.config,
-                    service_endpoint=domain.url
-                )
-                
-                # Try to get the user - if successful, they exist in this domain
-                user_response = domain_client.get_user(user_id=user_id)
-                if user_response.data:
-                    print(f"Found user in domain: {domain.display_name}")
-                    return ("identity_domain", domain.url)
-                    
-            except Exception:
-                # User not found in this domain, continue searching
-                continue
+        if domain is None and self._domains_from_cache:
+            # The user may be in a domain created since the listing was cached
+            print("User not found in cached domains, refreshing the domain list...")
+            self.domains_cache = None
+            self._domains_from_cache = False
+            probed = {d.url for d in domains}
+            domain = self._find_user_domain(user_id, [d for d in self.get_identity_domains() if d.url not in probed])
+        
+        if domain is None:
+            raise ValueError(f"User ID '{user_id}' not found in any identity domain or legacy IAM")
         
-        # If we get here, user not found in any domain
-        raise ValueError(f"User ID '{user_id}' not found in any identity domain or legacy IAM")
+        print(f"Found user in domain: {domain.display_name}")
+        return ("identity_domain", domain.url)
+    
+    def _find_user_domain(self, user_id: str, domains: List[oci.identity.models.Domain]):
+        """Probe all domains at once and return the first one that knows the user, or None."""
+        executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+        found = False
+        try:
+            futures = {executor.submit(self._user_exists_in_domain, user_id, domain): domain
+                       for domain in domains}
+            for future in as_completed(futures):
+                if future.result():
+                    found = True
+                    return futures[future]
+        finally:
+            # After a hit, return without waiting for the probes still in flight
+            if found and sys.version_info >= (3, 9):
+                executor.shutdown(wait=False, cancel_futures=True)
+            else:
+                executor.shutdown(wait=not found)
+        return None
     
     def get_user_info_legacy(self, user_id: str) -> Dict:
         """Get user information from Legacy IAM."""
@@ -97,10 +244,7 @@ class OCIPolicyAnalyzer:
     def get_user_info_identity_domain(self, user_id: str, domain_url: str) -> Dict:
         """Get user information from Identity Domain."""
         try:
-            domain_client = oci.identity_domains.IdentityDomainsClient(
-                config=self.config,
-                service_endpoint=domain_url
-            )
+            domain_client = self._get_domain_client(domain_url)
             
             user = domain_client.get_user(user_id=user_id)
             email = user.data.emails[0].value if user.data.emails else 'N/A'
@@ -116,10 +260,28 @@ class OCIPolicyAnalyzer:
             print(f"Error fetching identity domain user info: {e}")
             return None
     
+    def _list_all_scim_resources(self, list_func, **kwargs) -> List:
+        """Page through an Identity Domains SCIM list call and return every resource."""
+        resources = []
+        start_index = 1
+        
+        while True:
+            response = list_func(start_index=start_index, count=PAGE_LIMIT, **kwargs)
+            page = response.data.resources or []
+            resources.extend(page)
+            
+            total_results = response.data.total_results or 0
+            if not page or len(resources) >= total_results:
+                break
+            start_index += len(page)
+        
+        return resources
+    
     def get_compartment_name(self, compartment_id: str) -> str:
         """Get compartment name from OCID, with caching."""
-        if compartment_id in self.compartment_cache:
-            return self.compartment_cache[compartment_id]
+        with self._compartment_cache_lock:
+            if compartment_id in self.compartment_cache:
+                return self.compartment_cache[compartment_id]
         
         try:
             if compartment_id == self.tenancy_id:
@@ -128,7 +290,8 @@ class OCIPolicyAnalyzer:
                 compartment = self.identity_client.get_compartment(compartment_id)
                 name = compartment.data.name
             
-            self.compartment_cache[compartment_id] = name
+            with self._compartment_cache_lock:
+                self.compartment_cache[compartment_id] = name
             return name
         except Exception as e:
             print(f"Warning: Could not resolve compartment {compartment_id}: {e}")
@@ -136,15 +299,20 @@ class OCIPolicyAnalyzer:
     
     def get_all_compartments(self) -> List[oci.identity.models.Compartment]:
         """Get all ACTIVE compartments in the tenancy."""
+        if self.compartments_cache is not None:
+            return self.compartments_cache
+        
         print("Fetching all active compartments...")
         compartments = []
         
         try:
             # Get all compartments recursively
-            response = self.identity_client.list_compartments(
+            response = list_call_get_all_results(
+                self.identity_client.list_compartments,
                 compartment_id=self.tenancy_id,
                 compartment_id_in_subtree=True,
-                access_level="ANY"
+                access_level="ANY",
+                limit=PAGE_LIMIT
             )
             
             # Filter for only ACTIVE compartments
@@ -154,6 +322,7 @@ class OCIPolicyAnalyzer:
             ]
             
             compartments = active_compartments
+            self.compartments_cache = compartments
             print(f"Found {len(compartments)} active compartments")
             
         except Exception as e:
@@ -167,16 +336,24 @@ class OCIPolicyAnalyzer:
         groups = []
         
         try:
-            response = self.identity_client.list_user_group_memberships(
+            response = list_call_get_all_results(
+                self.identity_client.list_user_group_memberships,
                 compartment_id=self.tenancy_id,
-                user_id=user_id
+                user_id=user_id,
+                limit=PAGE_LIMIT
             )
             
             # Get full group details
             group_ids = [membership.group_id for membership in response.data]
-            for group_id in group_ids:
-                group = self.identity_client.get_group(group_id)
-                groups.append(group.data)
+            with ThreadPoolExecutor(max_workers=GROUP_WORKERS) as executor:
+                futures = {executor.submit(self.identity_client.get_group, group_id): group_id
+                           for group_id in group_ids}
+                # Collect in membership order so the group listing is stable between runs
+                for future, group_id in futures.items():
+                    try:
+                        groups.append(future.result().data)
+                    except Exception as e:
+                        print(f"Warning: Could not fetch group details for {group_id}: {e}")
             
             print(f"User belongs to {len(groups)} groups:")
             for group in groups:
@@ -192,18 +369,15 @@ class OCIPolicyAnalyzer:
         """Get all groups that an Identity Domain user belongs to."""
         print(f"Fetching groups for identity domain user: {user_id}")
         groups = []
+        domain_client = self._get_domain_client(domain_url)
         
         try:
-            domain_client = oci.identity_domains.IdentityDomainsClient(
-                config=self.config,
-                service_endpoint=domain_url
-            )
-            
             # Get user and check groups
             user = domain_client.get_user(user_id=user_id, attributes="groups")
             
-            if hasattr(user.data, 'groups') and user.data.groups:
-                for group_ref in user.data.groups:
+            user_groups = getattr(user.data, 'groups', None)
+            if user_groups:
+                for group_ref in user_groups:
                     # Get full group details
                     try:
                         group = domain_client.get_group(group_id=group_ref.value)
@@ -219,48 +393,42 @@ class OCIPolicyAnalyzer:
             for group in groups:
                 print(f"  - {group['name']} ({group['id']})")
                 
-        except Exception as e:
-            print(f"Trying alternative method to find user groups...")
-            # Try alternative method - list all groups and check membership
-            return self.get_identity_domain_groups_alternative(user_id, domain_url)
+        except oci.exceptions.ServiceError as e:
+            # Only fall back when the domain cannot return groups for the user;
+            # authorization and server errors are real failures
+            if e.status not in (400, 404):
+                raise
+            # Try alternative method - look up the groups that list the user as a member
+            return self.get_identity_domain_groups_alternative(user_id, domain_client)
         
         return groups
     
-    def get_identity_domain_groups_alternative(self, user_id: str, domain_url: str) -> List[Dict]:
-        """Alternative method to get Identity Domain user groups by checking all groups."""
+    def get_identity_domain_groups_alternative(self, user_id: str,
+                                               domain_client: oci.identity_domains.IdentityDomainsClient) -> List[Dict]:
+        """Alternative method to get Identity Domain user groups by querying group membership."""
         print("Trying alternative method to find user groups...")
         groups = []
         
         try:
-            domain_client = oci.identity_domains.IdentityDomainsClient(
-                config=self.config,
-                service_endpoint=domain_url
-            )
-            
-            # List all groups in the domain
-            all_groups_response = domain_client.list_groups()
+            try:
+                # Let the domain return only the groups the user is a member of
+                member_groups = self._list_all_scim_resources(
+                    domain_client.list_groups,
+                    filter=f'members.value eq "{user_id}"',
+                    attributes="displayName,id"
+                )
+            except oci.exceptions.ServiceError as e:
+                if e.status != 400:
+                    raise
+                print("Domain rejected the membership filter, checking every group...")
+                member_groups = self._scan_groups_for_member(domain_client, user_id)
             
-            # Check each group for membership
-            for group in all_groups_response.data.resources:
-                try:
-                    # Get group members
-                    group_detail = domain_client.get_group(
-                        group_id=group.id,
-                        attributes="members"
-                    )
-                    
-                    if hasattr(group_detail.data, 'members') and group_detail.data.members:
-                        member_ids = [member.value for member in group_detail.data.members]
-                        if user_id in member_ids:
-                            groups.append({
-                                'name': group.display_name,
-                                'id': group.id,
-                                'type': 'identity_domain'
-                            })
-                            
-                except Exception as e:
-                    print(f"Warning: Could not check group {group.display_name}: {e}")
-                    continue
+            for group in member_groups:
+                groups.append({
+                    'name': group.display_name,
+                    'id': group.id,
+                    'type': 'identity_domain'
+                })
             
             print(f"Found {len(groups)} groups via alternative method:")
             for group in groups:
@@ -271,55 +439,124 @@ class OCIPolicyAnalyzer:
         
         return groups
     
+    def _scan_groups_for_member(self, domain_client, user_id: str) -> List:
+        """Find the groups containing a user by fetching the members of every group in the domain."""
+        member_groups = []
+        
+        # List all groups in the domain
+        all_groups = self._list_all_scim_resources(domain_client.list_groups)
+        
+        # Fetch group members for all groups concurrently
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = [
+                executor.submit(domain_client.get_group, group_id=group.id, attributes="members")
+                for group in all_groups
+            ]
+        
+        # Check each group for membership
+        for group, future in zip(all_groups, futures):
+            try:
+                group_detail = future.result()
+                
+                members = getattr(group_detail.data, 'members', None)
+                if members:
+                    member_ids = [member.value for member in members]
+                    if user_id in member_ids:
+                        member_groups.append(group)
+                        
+            except Exception as e:
+                print(f"Warning: Could not check group {group.display_name}: {e}")
+                continue
+        
+        return member_groups
+    
     def get_policies_in_compartment(self, compartment_id: str) -> List[oci.identity.models.Policy]:
         """Get all policies in a specific compartment."""
         try:
-            response = self.identity_client.list_policies(compartment_id=compartment_id)
+            response = list_call_get_all_results(
+                self.identity_client.list_policies,
+                compartment_id=compartment_id,
+                limit=PAGE_LIMIT
+            )
             return response.data
         except Exception as e:
             print(f"Warning: Could not fetch policies in compartment {compartment_id}: {e}")
             return []
     
+    def get_policies_by_compartment(self, stop_event: Optional[threading.Event] = None) -> Tuple[List[oci.identity.models.Compartment], List[str],
+                                                   List[List[oci.identity.models.Policy]]]:
+        """
+        Get all active compartments and the policies in each of them, including root.
+        Returns: (compartments, compartment_ids, policies) where policies[i] belongs to compartment_ids[i]
+        Once stop_event is set, compartments whose fetch has not started yet are skipped.
+        """
+        # Get all active compartments (including root)
+        compartments = self.get_all_compartments()
+        # Seed the name cache so compartment lookups never hit the API
+        with self._compartment_cache_lock:
+            self.compartment_cache.update({comp.id: comp.name for comp in compartments})
+            self.compartment_cache[self.tenancy_id] = "root"
+        # Add root tenancy to the list (root is always active)
+        all_compartment_ids = [self.tenancy_id] + [comp.id for comp in compartments]
+        
+        def fetch_policies(compartment_id):
+            if stop_event is not None and stop_event.is_set():
+                return []
+            return self.get_policies_in_compartment(compartment_id)
+        
+        # Fetch policies for all compartments concurrently; results keep compartment order
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            policies_per_compartment = list(executor.map(fetch_policies, all_compartment_ids))
+        
+        return compartments, all_compartment_ids, policies_per_compartment
+    
     def translate_compartment_ids_in_statement(self, statement: str) -> str:
         """Replace compartment OCIDs in policy statements with human-readable names."""
-        # Pattern to match compartment OCIDs in policy statements
-        compartment_pattern = r'compartment\s+(ocid1\.compartment\.[a-zA-Z0-9\._-]+)'
+        # Most statements reference compartments by name, so skip the regex entirely
+        if 'ocid1.compartment.' not in statement:
+            return statement
+        if statement in self._translate_cache:
+            return self._translate_cache[statement]
         
         def replace_compartment(match):
             compartment_id = match.group(1)
             compartment_name = self.get_compartment_name(compartment_id)
             return f'compartment {compartment_name}'
         
-        return re.sub(compartment_pattern, replace_compartment, statement, flags=re.IGNORECASE)
+        translated = _COMPARTMENT_RE.sub(replace_compartment, statement)
+        self._translate_cache[statement] = translated
+        return translated
     
     def filter_policies_for_groups(self, policies: List[oci.identity.models.Policy], 
                                  group_names: Set[str]) -> List[tuple]:
         """Filter policies that contain statements referencing the user's groups."""
         relevant_policies = []
+        if not group_names:
+            return relevant_policies
+        
+        # Lowercase once so the same pattern is reused for every compartment
+        group_pattern = compile_group_pattern(frozenset(name.lower() for name in group_names))
+        # Compartment names are only resolved for policies that have a matching statement
+        name_cache = {}
         
         for policy in policies:
-            policy_compartment_name = self.get_compartment_name(policy.compartment_id)
-            
             for statement in policy.statements:
+                # Cheap substring check first; statements for any-user, services, etc. skip the regex
+                if 'group' not in statement.lower():
+                    continue
                 # Check if statement mentions any of the user's groups
-                statement_lower = statement.lower()
-                
-                for group_name in group_names:
-                    # Look for patterns like "group GroupName" or "group 'GroupName'"
-                    group_patterns = [
-                        f"group {group_name.lower()}",
-                        f"group '{group_name.lower()}'",
-                        f'group "{group_name.lower()}"'
-                    ]
-                    
-                    if any(pattern in statement_lower for pattern in group_patterns):
-                        translated_statement = self.translate_compartment_ids_in_statement(statement)
-                        relevant_policies.append((
-                            policy.name,
-                            policy_compartment_name,
-                            translated_statement
-                        ))
-                        break
+                if group_pattern.search(statement):
+                    policy_compartment_name = name_cache.get(policy.compartment_id)
+                    if policy_compartment_name is None:
+                        policy_compartment_name = self.get_compartment_name(policy.compartment_id)
+                        name_cache[policy.compartment_id] = policy_compartment_name
+                    translated_statement = self.translate_compartment_ids_in_statement(statement)
+                    # Names repeat once per matching statement, so share a single copy of each
+                    relevant_policies.append((
+                        sys.intern(policy.name),
+                        sys.intern(policy_compartment_name),
+                        translated_statement
+                    ))
         
         return relevant_policies
     
@@ -327,23 +564,10 @@ class OCIPolicyAnalyzer:
         """Main method to analyze all policies that apply to a user."""
         print(f"\n=== OCI Policy Analysis for User: {user_id} ===\n")
         
-        # Detect user type and get user info
+        # Detect user type first, so malformed or unknown IDs never start the tenancy-wide scan
         try:
             user_type, domain_url = self.detect_user_id_type(user_id)
             print(f"Detected user type: {user_type}")
-            
-            if user_type == "legacy":
-                user_info = self.get_user_info_legacy(user_id)
-                groups = self.get_user_groups_legacy(user_id)
-                group_names = {group.name for group in groups}
-            else:  # identity_domain
-                user_info = self.get_user_info_identity_domain(user_id, domain_url)
-                groups = self.get_user_groups_identity_domain(user_id, domain_url)
-                group_names = {group['name'] for group in groups}
-            
-            if user_info:
-                print(f"User: {user_info['name']} ({user_info['email']})")
-            
         except ValueError as e:
             print(f"Error: {e}")
             return
@@ -351,31 +575,58 @@ class OCIPolicyAnalyzer:
             print(f"Unexpected error: {e}")
             return
         
-        if not groups:
-            print("No groups found for user or error occurred.")
-            return
-        
-        # Get all active compartments (including root)
-        compartments = self.get_all_compartments()
-        # Add root tenancy to the list (root is always active)
-        all_compartment_ids = [self.tenancy_id] + [comp.id for comp in compartments]
+        # Compartment and policy discovery do not depend on the user, so run it
+        # in the background while the user's groups are looked up
+        stop_prefetch = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=1)
+        tenancy_policies = executor.submit(self.get_policies_by_compartment, stop_prefetch)
+        try:
+            try:
+                if user_type == "legacy":
+                    user_info = self.get_user_info_legacy(user_id)
+                    groups = self.get_user_groups_legacy(user_id)
+                    group_names = {group.name for group in groups}
+                else:  # identity_domain
+                    user_info = self.get_user_info_identity_domain(user_id, domain_url)
+                    groups = self.get_user_groups_identity_domain(user_id, domain_url)
+                    group_names = {group['name'] for group in groups}
+                
+                if user_info:
+                    print(f"User: {user_info['name']} ({user_info['email']})")
+                
+            except ValueError as e:
+                print(f"Error: {e}")
+                return
+            except Exception as e:
+                print(f"Unexpected error: {e}")
+                return
+            
+            if not groups:
+                print("No groups found for user or error occurred.")
+                return
+            
+            compartments, all_compartment_ids, policies_per_compartment = tenancy_policies.result()
+        finally:
+            if not tenancy_policies.done():
+                # Result abandoned (early return or Ctrl-C): drop the policy fetches not yet started
+                stop_prefetch.set()
+                tenancy_policies.cancel()
+            executor.shutdown(wait=True)
         
-        print(f"\nScanning policies in {len(all_compartment_ids)} active compartments:")
-        print(f"  - Root tenancy: {self.tenancy_id}")
+        print(f"\nScanning policies in {len(all_compartment_ids)} active compartments\n")
+        log.debug("  - Root tenancy: %s", self.tenancy_id)
         for comp in compartments:
-            print(f"  - {comp.name} ({comp.lifecycle_state}): {comp.id}")
-        print()
+            log.debug("  - %s (%s): %s", comp.name, comp.lifecycle_state, comp.id)
         
         # Collect all relevant policies
         all_relevant_policies = []
         
-        for compartment_id in all_compartment_ids:
-            compartment_name = self.get_compartment_name(compartment_id)
-            print(f"Checking policies in: {compartment_name}")
-            policies = self.get_policies_in_compartment(compartment_id)
-            print(f"  Found {len(policies)} policies")
+        for compartment_id, policies in zip(all_compartment_ids, policies_per_compartment):
             relevant_policies = self.filter_policies_for_groups(policies, group_names)
-            print(f"  {len(relevant_policies)} policies apply to user's groups")
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("Checking policies in: %s", self.get_compartment_name(compartment_id))
+                log.debug("  Found %d policies", len(policies))
+                log.debug("  %d policies apply to user's groups", len(relevant_policies))
             all_relevant_policies.extend(relevant_policies)
         
         # Display results
@@ -383,23 +634,23 @@ class OCIPolicyAnalyzer:
             print("No policy statements found that apply to this user's groups.")
             return
         
-        print(f"Found {len(all_relevant_policies)} policy statements that apply to this user:\n")
-        print("=" * 80)
+        lines = [f"Found {len(all_relevant_policies)} policy statements that apply to this user:\n"]
+        lines.append("=" * 80)
         
         # Group by policy and compartment for cleaner output
-        policy_groups = defaultdict(list)
+        policy_groups = {}
         for policy_name, compartment_name, statement in all_relevant_policies:
-            policy_groups[(policy_name, compartment_name)].append(statement)
+            policy_groups.setdefault((policy_name, compartment_name), []).append(statement)
         
         for (policy_name, compartment_name), statements in policy_groups.items():
-            print(f"\nPolicy: {policy_name}")
-            print(f"Compartment: {compartment_name}")
-            print("-" * 40)
-            for statement in statements:
-                print(f"  {statement}")
-        
-        print("\n" + "=" * 80)
-        print(f"Analysis complete. Total statements: {len(all_relevant_policies)}")
+            lines.append(f"\nPolicy: {policy_name}")
+            lines.append(f"Compartment: {compartment_name}")
+            lines.append("-" * 40)
+            lines.extend(f"  {statement}" for statement in statements)
+        
+        lines.append("\n" + "=" * 80)
+        lines.append(f"Analysis complete. Total statements: {len(all_relevant_policies)}")
+        sys.stdout.write("\n".join(lines) + "\n")
 
 
 def main():
@@ -408,8 +659,17 @@ def main():
         print("Examples:")
         print("  Legacy IAM: python oci_policy_analyzer.py ocid1.user.oc1..aaaaaaaa...")
         print("  Identity Domain: python oci_policy_analyzer.py 81a9295fd751480daec690c975029513")
+        print("Set OCI_POLICY_LOG_LEVEL=DEBUG to show per-compartment scan details.")
+        print("Set OCI_POLICY_DOMAIN_URL to the domain URL to skip searching every identity domain.")
+        print("Set OCI_POLICY_NO_CACHE=1 to ignore identity domains cached by earlier runs.")
         sys.exit(1)
     
+    log_level = os.environ.get("OCI_POLICY_LOG_LEVEL", "WARNING").upper()
+    if log_level not in ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"):
+        print(f"Ignoring unknown OCI_POLICY_LOG_LEVEL '{log_level}', using WARNING")
+        log_level = "WARNING"
+    logging.basicConfig(level=log_level, format="%(message)s")
+    
     user_id = sys.argv[1]
     
     # Basic validation
@@ -420,6 +680,7 @@ def main():
     try:
         analyzer = OCIPolicyAnalyzer()
         analyzer.analyze_user_policies(user_id)
+        analyzer.save_cache()
     except KeyboardInterrupt:
         print("\nAnalysis interrupted by user.")
     except Exception as e:
@@ -11,16 +11,20 @@ Dependencies will be automatically installed if missing.
 import subprocess
 import sys
 import importlib
+import logging
 from datetime import datetime
 
+# Progress and errors; routed to stderr by start_log_listener() so stdout carries only the report
+logger = logging.getLogger('oci_scan')
+
 def install_package(package):
     """Install a package using pip"""
-    print(f"Installing {package}...")
+    logger.info("Installing %s...", package)
     try:
         subprocess.check_call([sys.executable, "-m", "pip", "install", package])
-        print(f"Successfully installed {package}")
+        logger.info("Successfully installed %s", package)
     except subprocess.CalledProcessError as e:
-        print(f"Failed to install {package}: {e}")
+        logger.error("Failed to install %s: %s", package, e)
         sys.exit(1)
 
 def import_or_install(package, import_name=None):
@@ -35,18 +39,112 @@ def import_or_install(package, import_name=None):
         try:
             return importlib.import_module(import_name)
         except ImportError:
-            print(f"Failed to import {import_name} after installation")
+            logger.error("Failed to import %s after installation", import_name)
             sys.exit(1)
 
-# Auto-install and import required packages
-print("Checking dependencies...")
-oci = import_or_install("oci")
-tabulate_module = import_or_install("tabulate")
-tabulate = tabulate_module.tabulate
+# Required packages, imported by load_dependencies() once the arguments are parsed
+oci = None
+tabulate = None
+aiolimiter = None
+
+
+def load_dependencies():
+    """Auto-install and import required packages; deferred so --help and argument errors return quickly"""
+    global oci, tabulate, aiolimiter
+    logger.info("Checking dependencies...")
+    oci = import_or_install("oci")
+    tabulate_module = import_or_install("tabulate")
+    tabulate = tabulate_module.tabulate
+    aiolimiter = import_or_install("aiolimiter")
+    use_fast_json_parser()
+
+
+def use_fast_json_parser():
+    """Parse SDK responses with orjson when it is installed; large SCIM user pages otherwise spend most of their time in json.loads"""
+    try:
+        import orjson
+    except ImportError:
+        return
+    
+    import json
+    
+    class _OrjsonShim:
+        dumps = staticmethod(json.dumps)
+        
+        @staticmethod
+        def loads(s, strict=True):
+            # orjson always rejects control characters, so lenient parsing stays on the stdlib
+            if not strict:
+                return json.loads(s, strict=False)
+            return orjson.loads(s)
+    
+    # The SDK deserializes every response through the json module bound in oci.base_client
+    oci.base_client.json = _OrjsonShim
+
 
 # Import other standard library modules
 import argparse
+import asyncio
+import csv
+import functools
+import hashlib
+import json
+import logging.handlers
+import operator
+import os
+import queue
+import re
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Matches the OCI SDK's default connection pool size per client
+MAX_WORKERS = 10
+# Concurrent page requests per identity domain
+PAGE_FETCH_CONCURRENCY = 8
+# SCIM page size: the service maximum, halved down to the minimum if a domain rejects it
+MAX_PAGE_SIZE = 1000
+MIN_PAGE_SIZE = 100
+# Default cap on identity domain API requests per second across all domains
+DEFAULT_MAX_RATE = 20
+# Large write buffer so streamed CSV rows reach disk in big chunks
+CSV_BUFFER_SIZE = 1 << 20
+# Rows collected before each writerows() call on the CSV export
+CSV_BATCH_SIZE = 10000
+# CSV export columns: row dict keys and the header written for them
+CSV_FIELDS = ['domain_name', 'domain_type', 'domain_id', 'username', 'display_name', 'email', 'status', 'created',
+              'user_id']
+CSV_HEADERS = ['Domain Name', 'Domain Type', 'Domain ID', 'Username', 'Display Name', 'Email', 'Status', 'Created',
+               'User ID']
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+# On-disk cache of scan results, so repeated runs within the TTL skip the API entirely
+CACHE_DIR = os.path.expanduser('~/.cache/oci_domains_list')
+DEFAULT_CACHE_TTL = 300
+DEFAULT_TABLE_FORMAT = 'simple'
+# Above this many rows, tables are printed tab-separated since tabulate's width calculation dominates
+TABULATE_MAX_ROWS = 1000
+# Identity domain user fields read for every user, fetched in a single call
+_user_fields = operator.attrgetter('user_name', 'id', 'active', 'emails', 'display_name', 'meta')
+# A 400 naming the count parameter means the page size was rejected, not the filter or other arguments
+_page_size_error = re.compile(r'\bcount\b', re.IGNORECASE).search
+# SCIM attributes requested from identity domains; only what the report and CSV use
+USER_ATTRIBUTES = "userName,displayName,emails.value,active,meta.created,id"
+
+
+class UserRow:
+    """One user as reported and exported; slotted because large tenancies keep many thousands in memory"""
+    __slots__ = ('username', 'email', 'user_id', 'status', 'created', 'display_name')
+    
+    def __init__(self, username, email, user_id, status, created, display_name='N/A'):
+        self.username = username
+        self.email = email
+        self.user_id = user_id
+        self.status = status
+        self.created = created
+        self.display_name = display_name
+    
+    def as_dict(self):
+        """Field values keyed by name, as stored in the scan cache"""
+        return {field: getattr(self, field) for field in self.__slots__}
 
 
 def get_oci_config(profile_name="DEFAULT"):
@@ -63,145 +161,427 @@ def get_oci_config(profile_name="DEFAULT"):
             return config
         except Exception:
             # If that fails too, create a minimal config for Cloud Shell
-            print(f"Using instance principal authentication...")
+            logger.info("Using instance principal authentication...")
             # This will work in Cloud Shell
             return {}
 
 
+def build_retry_strategy():
+    """Retry throttled (429) and transient 5xx responses with jittered exponential backoff"""
+    return oci.retry.RetryStrategyBuilder(
+        max_attempts=10,
+        total_elapsed_time_seconds=900,
+        service_error_retry_config={
+            429: [],
+            400: ['TooManyRequests', 'QuotaExceeded']
+        },
+        service_error_retry_on_any_5xx=True,
+        backoff_type=oci.retry.BACKOFF_FULL_JITTER_EQUAL_ON_THROTTLE_VALUE
+    ).get_retry_strategy()
+
+
+def split_usernames(filter_username):
+    """Split a comma-separated --username value into the individual names to match"""
+    return [name.strip() for name in filter_username.split(',') if name.strip()]
+
+
 def get_all_domains(identity_client, compartment_id):
-    """Get all identity domains in the tenancy"""
+    """Get all identity domains in the tenancy, or None if they could not be listed"""
     try:
-        domains = identity_client.list_domains(compartment_id=compartment_id)
+        # Follow opc-next-page so tenancies with more than one page of domains are fully listed
+        domains = oci.pagination.list_call_get_all_results(identity_client.list_domains, compartment_id=compartment_id)
         return domains.data
     except Exception as e:
-        print(f"Error listing domains: {e}")
-        return []
+        logger.error("Error listing domains: %s", e)
+        return None
 
 
-def get_legacy_users(identity_client, tenancy_id, filter_username=None):
-    """Get all users from the root tenancy (legacy IAM)"""
+def get_legacy_users(identity_client, tenancy_id, on_user, filter_username=None):
+    """Get all users from the root tenancy (legacy IAM), passing each one to on_user; False if listing failed"""
     try:
-        users = identity_client.list_users(compartment_id=tenancy_id)
-        user_list = []
+        # Lazily follow opc-next-page so every page is seen and only one is held at a time
+        users = oci.pagination.list_call_get_all_results_generator(
+            identity_client.list_users, 'record', compartment_id=tenancy_id
+        )
         
-        for user in users.data:
+        # Case-insensitive substring matcher for any of the names, built once instead of lowercasing per user
+        matches = None
+        if filter_username:
+            pattern = '|'.join(re.escape(name) for name in split_usernames(filter_username))
+            matches = re.compile(pattern, re.IGNORECASE).search
+        
+        for user in users:
             # Apply username filter if provided
-            if filter_username:
-                if (filter_username.lower() not in user.name.lower() and 
-                    filter_username.lower() not in (user.email or '').lower()):
-                    continue
+            if matches and not (matches(user.name) or matches(user.email or '')):
+                continue
             
-            user_list.append({
-                'username': user.name,
-                'email': user.email or 'N/A',
-                'user_id': user.id,
-                'status': user.lifecycle_state,
-                'created': user.time_created.strftime('%Y-%m-%d %H:%M:%S') if user.time_created else 'N/A',
-                'description': user.description or 'N/A'
-            })
-        
-        return user_list
+            on_user(UserRow(
+                username=user.name,
+                email=user.email or 'N/A',
+                user_id=user.id,
+                status=user.lifecycle_state,
+                created=user.time_created.strftime(DATE_FORMAT) if user.time_created else 'N/A'
+            ))
     except Exception as e:
-        print(f"Error getting legacy users: {e}")
-        return []
+        logger.error("Error getting legacy users: %s", e)
+        return False
+    return True
+
+
+# Identity Domains clients already built in this process, keyed by domain URL
+_domain_clients = {}
 
 
-def create_identity_domains_client(config, domain_url):
-    """Create Identity Domains client for a specific domain"""
+def create_identity_domains_client(config, signer, domain_url):
+    """Create Identity Domains client for a specific domain, reusing one built earlier for the same URL"""
+    if domain_url in _domain_clients:
+        return _domain_clients[domain_url]
+    
     try:
         # Identity Domains client requires service_endpoint parameter
-        return oci.identity_domains.IdentityDomainsClient(
+        domain_client = oci.identity_domains.IdentityDomainsClient(
             config=config,
-            service_endpoint=domain_url
+            signer=signer,
+            service_endpoint=domain_url,
+            retry_strategy=build_retry_strategy()
         )
     except Exception as e:
-        print(f"Error creating Identity Domains client: {e}")
+        logger.error("Error creating Identity Domains client: %s", e)
         return None
+    
+    return _domain_clients.setdefault(domain_url, domain_client)
 
 
-def get_identity_domain_users(domain_client, filter_username=None):
-    """Get all users from an identity domain"""
+async def get_identity_domain_users(loop, executor, limiter, domain_client, domain_name, on_user,
+                                    filter_username=None):
+    """Get all users from an identity domain, passing each one to on_user as its page arrives; False on error"""
     try:
         # Get all users with pagination support
-        users = []
-        start_index = 1
-        count = 100  # Max items per page
+        count = MAX_PAGE_SIZE
         
         # If filtering by username, use SCIM filter for efficiency
         scim_filter = None
         if filter_username:
-            # Create SCIM filter for username or email contains
-            scim_filter = f'userName co "{filter_username}" or emails.value co "{filter_username}"'
+            # Create SCIM filter for username or email contains, one request covering every name
+            scim_filter = ' or '.join(f'userName co "{name}" or emails.value co "{name}"'
+                                      for name in split_usernames(filter_username))
         
-        while True:
-            if scim_filter:
-                response = domain_client.list_users(
-                    start_index=start_index,
-                    count=count,
-                    filter=scim_filter,
-                    attributes="userName,displayName,emails,active,meta,name"
-                )
-            else:
-                response = domain_client.list_users(
-                    start_index=start_index,
-                    count=count,
-                    attributes="userName,displayName,emails,active,meta,name"
-                )
-            
-            if not response.data.resources:
-                break
-                
-            for user in response.data.resources:
-                # Apply additional client-side filtering if needed
-                if filter_username and not scim_filter:
-                    user_email = user.emails[0].value if user.emails else ''
-                    if (filter_username.lower() not in user.user_name.lower() and 
-                        filter_username.lower() not in user_email.lower()):
-                        continue
-                
+        list_kwargs = dict(count=count, attributes=USER_ATTRIBUTES)
+        if scim_filter:
+            list_kwargs['filter'] = scim_filter
+        
+        # Bound the number of in-flight page requests per domain
+        semaphore = asyncio.Semaphore(PAGE_FETCH_CONCURRENCY)
+        
+        async def fetch_page(start_index, page_size=None):
+            kwargs = dict(list_kwargs, count=page_size) if page_size else list_kwargs
+            list_page = functools.partial(domain_client.list_users, start_index=start_index, **kwargs)
+            async with semaphore, limiter:
+                return await loop.run_in_executor(executor, list_page)
+        
+        def emit_page(response):
+            """Pass each user on a page to on_user, so only pages still in flight are held in memory"""
+            # Username filtering already happened server-side through the SCIM filter
+            for user in response.data.resources or []:
                 # Extract user information
-                email = user.emails[0].value if user.emails else 'N/A'
-                display_name = getattr(user, 'display_name', 'N/A')
+                user_name, user_id, active, emails, display_name, meta = _user_fields(user)
+                email = emails[0].value if emails else 'N/A'
                 created_date = 'N/A'
                 
-                # Try to get creation date from meta
-                if hasattr(user, 'meta') and user.meta:
-                    if hasattr(user.meta, 'created'):
-                        try:
-                            created_date = user.meta.created.strftime('%Y-%m-%d %H:%M:%S')
-                        except:
-                            created_date = str(user.meta.created)
+                # Creation date from meta; the SDK normally returns it as an ISO string
+                if meta and meta.created:
+                    created = meta.created
+                    created_date = created.strftime(DATE_FORMAT) if isinstance(created, datetime) else str(created)
                 
-                users.append({
-                    'username': user.user_name,
-                    'display_name': display_name,
-                    'email': email,
-                    'user_id': user.id,
-                    'status': 'Active' if user.active else 'Inactive',
-                    'created': created_date
-                })
-            
-            # Check if there are more pages
-            if len(response.data.resources) < count:
+                on_user(UserRow(
+                    username=user_name,
+                    display_name=display_name,
+                    email=email,
+                    user_id=user_id,
+                    status='Active' if active else 'Inactive',
+                    created=created_date
+                ))
+        
+        async def fetch_span(start_index, end_index):
+            """Fetch the users from start_index up to end_index, following up on pages shorter than asked for"""
+            while start_index < end_index:
+                page = await fetch_page(start_index, min(count, end_index - start_index))
+                received = len(page.data.resources or [])
+                if not received:
+                    raise RuntimeError(f"Expected {total_results} users but the listing ended at {start_index - 1}")
+                emit_page(page)
+                start_index += received
+        
+        # The first page reports totalResults; its length is the page size the server actually honors
+        while True:
+            try:
+                first_page = await fetch_page(1)
                 break
-            start_index += count
-            
-            # Small delay to avoid rate limiting
-            time.sleep(0.2)
+            except oci.exceptions.ServiceError as e:
+                if e.status != 400 or count // 2 < MIN_PAGE_SIZE or not _page_size_error(f"{e.code} {e.message}"):
+                    raise
+                # Page size rejected; retry with smaller pages
+                count //= 2
+                list_kwargs['count'] = count
+        total_results = first_page.data.total_results or 0
+        stride = len(first_page.data.resources or [])
+        if total_results and not stride:
+            raise RuntimeError(f"Expected {total_results} users but the first page was empty")
+        emit_page(first_page)
         
-        return users
+        # SCIM servers may return short pages, so each span re-requests whatever it did not receive
+        spans = [
+            asyncio.ensure_future(fetch_span(start_index, min(start_index + stride, total_results + 1)))
+            for start_index in range(1 + stride, total_results + 1, stride or 1)
+        ]
+        try:
+            await asyncio.gather(*spans)
+        except BaseException:
+            # Stop the other spans so a failed domain gets no further users
+            for span in spans:
+                span.cancel()
+            raise
     except Exception as e:
-        if "NotAuthorizedOrNotFound" in str(e) or "authorization failed" in str(e).lower():
-            print(f"  No access to list users in this identity domain")
-        elif "404" in str(e):
-            print(f"  Domain endpoint not accessible")
+        print_identity_domain_error(e, domain_name)
+        return False
+    return True
+
+
+async def count_identity_domain_users(loop, executor, limiter, domain_client, domain_name):
+    """Get the number of users in an identity domain from a single SCIM request, or None on error"""
+    try:
+        # count=0 returns no resources, only the totalResults envelope
+        list_page = functools.partial(domain_client.list_users, count=0)
+        async with limiter:
+            response = await loop.run_in_executor(executor, list_page)
+        return response.data.total_results or 0
+    except Exception as e:
+        print_identity_domain_error(e, domain_name)
+        return None
+
+
+def print_identity_domain_error(e, domain_name):
+    """Explain why users of an identity domain could not be listed; domains are scanned concurrently, so name it"""
+    if "NotAuthorizedOrNotFound" in str(e) or "authorization failed" in str(e).lower():
+        logger.warning("No access to list users in identity domain %s", domain_name)
+    elif "404" in str(e):
+        logger.warning("Domain endpoint not accessible for %s", domain_name)
+    else:
+        logger.error("Error getting users of identity domain %s: %s", domain_name, e)
+
+
+class BatchedCsvWriter:
+    """csv.DictWriter wrapper that collects row dicts and writes them with writerows() in batches"""
+    
+    def __init__(self, csvfile, batch_size=CSV_BATCH_SIZE):
+        self._writer = csv.DictWriter(csvfile, fieldnames=CSV_FIELDS)
+        self._batch = []
+        self._batch_size = batch_size
+    
+    def writerow(self, row):
+        self._batch.append(row)
+        if len(self._batch) >= self._batch_size:
+            self.flush()
+    
+    def flush(self):
+        """Write any collected rows; call before closing the file"""
+        if self._batch:
+            self._writer.writerows(self._batch)
+            self._batch.clear()
+
+
+def open_csv_export(path, filter_username=None):
+    """Open the CSV export file and write its header rows, returning (file, writer)"""
+    csvfile = open(path, 'w', newline='', encoding='utf-8', buffering=CSV_BUFFER_SIZE)
+    preamble = csv.writer(csvfile)
+    if filter_username:
+        preamble.writerow(['# Filtered results for username:', filter_username])
+        preamble.writerow([])  # Empty row
+    
+    preamble.writerow(CSV_HEADERS)
+    return csvfile, BatchedCsvWriter(csvfile)
+
+
+def csv_row(domain_info, user):
+    """Build the CSV export row dict for one user"""
+    return {
+        'domain_name': domain_info['name'],
+        'domain_type': domain_info['type'],
+        'domain_id': domain_info['id'],  # Full OCID
+        'username': user.username,
+        'display_name': user.display_name,
+        'email': user.email,
+        'status': user.status,
+        'created': user.created,
+        'user_id': user.user_id  # Full OCID/ID
+    }
+
+
+def make_user_collector(domain_info, csv_writer=None, keep_users=True):
+    """Build the callback that counts each fetched user, streams it to CSV and optionally keeps it for display"""
+    def collect(user):
+        domain_info['user_count'] += 1
+        if keep_users:
+            domain_info['users'].append(user)
+        if csv_writer:
+            csv_writer.writerow(csv_row(domain_info, user))
+    return collect
+
+
+def scan_cache_path(tenancy_id, profile, filter_username=None, keep_users=True):
+    """Cache file for one combination of tenancy, profile, filter and whether users are listed"""
+    key = json.dumps([tenancy_id, profile, filter_username or '', keep_users])
+    return os.path.join(CACHE_DIR, hashlib.sha256(key.encode('utf-8')).hexdigest() + '.json')
+
+
+def load_cached_scan(path, ttl):
+    """Return the cached domains info if the cache file is younger than ttl seconds, otherwise None"""
+    try:
+        if time.time() - os.path.getmtime(path) > ttl:
+            return None
+        with open(path, encoding='utf-8') as f:
+            domains_info = json.load(f)
+        for domain_info in domains_info:
+            domain_info['users'] = [UserRow(**user) for user in domain_info['users']]
+        return domains_info
+    except (OSError, ValueError, TypeError, KeyError):
+        # Unreadable or from an older layout; scan again
+        return None
+
+
+def save_cached_scan(path, domains_info):
+    """Write the domains info to the cache file, storing each UserRow as a dict"""
+    try:
+        # Every user's email and ID ends up in here, so keep it private to the current user
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        try:
+            os.remove(tmp_path)  # A leftover file would keep its old permissions
+        except FileNotFoundError:
+            pass
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with open(fd, 'w', encoding='utf-8') as f:
+            json.dump(domains_info, f, default=UserRow.as_dict)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning("Could not write cache file %s: %s", path, e)
+
+
+async def process_domain(loop, executor, limiter, config, signer, domain, filter_username=None,
+                         csv_writer=None, keep_users=True):
+    """Fetch the users of one identity domain without blocking the event loop"""
+    logger.info("Processing domain: %s", domain.display_name)
+    domain_info = {
+        'name': domain.display_name,
+        'type': 'Identity Domain',
+        'id': domain.id,  # Full OCID
+        'url': domain.url,
+        'status': domain.lifecycle_state,
+        'users': [],
+        'user_count': 0,
+        # Set once every user was listed or counted; failed domains are never cached
+        'complete': False
+    }
+    
+    # Create Identity Domains client
+    domain_client = await loop.run_in_executor(executor, create_identity_domains_client, config, signer, domain.url)
+    if domain_client and not (filter_username or csv_writer or keep_users):
+        # Only the count is reported, so skip fetching the users themselves
+        user_count = await count_identity_domain_users(loop, executor, limiter, domain_client,
+                                                       domain.display_name)
+        domain_info['complete'] = user_count is not None
+        domain_info['user_count'] = user_count or 0
+        logger.info("Found %d users in %s", domain_info['user_count'], domain.display_name)
+    elif domain_client:
+        collect = make_user_collector(domain_info, csv_writer, keep_users)
+        domain_info['complete'] = await get_identity_domain_users(loop, executor, limiter, domain_client,
+                                                                  domain.display_name, collect, filter_username)
+        if filter_username:
+            logger.info("Found %d matching users in %s", domain_info['user_count'], domain.display_name)
         else:
-            print(f"  Error getting identity domain users: {e}")
-        return []
+            logger.info("Found %d users in %s", domain_info['user_count'], domain.display_name)
+    else:
+        logger.warning("Could not access %s", domain.display_name)
+    
+    return domain_info
+
+
+def make_rate_limiter(max_rate):
+    """Token bucket allowing max_rate requests per second; rates below 1 become one request per 1/max_rate seconds"""
+    # Each request takes one token, which a bucket holding less than one whole token could never grant
+    if max_rate < 1:
+        return aiolimiter.AsyncLimiter(1, 1 / max_rate)
+    return aiolimiter.AsyncLimiter(max_rate, 1)
 
 
-def print_domain_summary(domains_info, filter_username=None):
-    """Print a summary table of all domains"""
+async def scan_identity_domains(config, signer, domains, filter_username=None, max_rate=DEFAULT_MAX_RATE,
+                                csv_writer=None, keep_users=True, first_match=False):
+    """Scan all identity domains concurrently, returning their info in the original domain order
+
+    With first_match, the scan stops as soon as any domain has a matching user and only the
+    domains finished by then are returned.
+    """
+    loop = asyncio.get_running_loop()
+    # One token bucket shared by every domain, so the whole scan stays under the tenancy's rate limit
+    limiter = make_rate_limiter(max_rate)
+    executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    stopped_early = False
+    try:
+        tasks = [
+            asyncio.ensure_future(
+                process_domain(loop, executor, limiter, config, signer, domain, filter_username, csv_writer,
+                               keep_users)
+            )
+            for domain in domains
+        ]
+        if not first_match:
+            return await asyncio.gather(*tasks)
+        
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            if pending and any(task.result()['user_count'] for task in done):
+                for task in pending:
+                    task.cancel()
+                stopped_early = True
+                await asyncio.gather(*pending, return_exceptions=True)
+                logger.warning("Match found; %d domain(s) were not scanned, results are partial", len(pending))
+                break
+        return [task.result() for task in tasks if not task.cancelled()]
+    finally:
+        # After an early stop, don't block the report on requests that are still in flight
+        if stopped_early and sys.version_info >= (3, 9):
+            executor.shutdown(wait=False, cancel_futures=True)
+        else:
+            executor.shutdown(wait=not stopped_early)
+
+
+def start_log_listener(level=logging.INFO):
+    """Send progress through a queue drained by a single writer thread, so concurrent tasks never block on stderr"""
+    log_queue = queue.Queue(-1)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(level)
+    logger.propagate = False
+    
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    listener.start()
+    return listener
+
+
+def print_table(rows, headers, table_format=DEFAULT_TABLE_FORMAT):
+    """Print rows with tabulate, or as tab-separated lines for very large tables"""
+    if len(rows) > TABULATE_MAX_ROWS:
+        print('\t'.join(headers))
+        for row in rows:
+            print('\t'.join(map(str, row)))
+    else:
+        print(tabulate(rows, headers=headers, tablefmt=table_format))
+
+
+def print_domain_summary(domains_info, filter_username=None, table_format=DEFAULT_TABLE_FORMAT, total_users=None):
+    """Print a summary table of all domains; total_users is computed here unless the caller already has it"""
     print("\n" + "=" * 80)
     if filter_username:
         print(f"DOMAINS SUMMARY - FILTERED BY USERNAME: '{filter_username}'")
@@ -209,28 +589,24 @@ def print_domain_summary(domains_info, filter_username=None):
         print("DOMAINS SUMMARY")
     print("=" * 80)
     
-    summary_data = []
-    total_users = 0
-    
-    for domain_info in domains_info:
-        user_count = len(domain_info['users'])
-        total_users += user_count
-        
-        # Only show domains with users if filtering
-        if filter_username and user_count == 0:
-            continue
-        
-        summary_data.append([
+    if total_users is None:
+        total_users = sum(domain_info['user_count'] for domain_info in domains_info)
+    # Only show domains with users if filtering
+    summary_data = [
+        [
             domain_info['name'],
             domain_info['type'],
-            user_count,
+            domain_info['user_count'],
             domain_info['status'],
             domain_info['id']  # Full OCID - no truncation
-        ])
+        ]
+        for domain_info in domains_info
+        if not (filter_username and domain_info['user_count'] == 0)
+    ]
     
     if summary_data:
         headers = ['Domain Name', 'Type', 'User Count', 'Status', 'Domain ID']
-        print(tabulate(summary_data, headers=headers, tablefmt='grid'))
+        print_table(summary_data, headers, table_format)
         
         if filter_username:
             print(f"\nDomains with matches: {len(summary_data)}")
@@ -242,7 +618,7 @@ def print_domain_summary(domains_info, filter_username=None):
         print("No domains found with matching users.")
 
 
-def print_detailed_domain_info(domains_info, show_users=True, filter_username=None):
+def print_detailed_domain_info(domains_info, show_users=True, filter_username=None, table_format=DEFAULT_TABLE_FORMAT):
     """Print detailed information for each domain"""
     domains_to_show = domains_info
     
@@ -258,7 +634,7 @@ def print_detailed_domain_info(domains_info, show_users=True, filter_username=No
         print("=" * 80)
         print(f"Type: {domain_info['type']}")
         print(f"Status: {domain_info['status']}")
-        print(f"User Count: {len(domain_info['users'])}")
+        print(f"User Count: {domain_info['user_count']}")
         print(f"Domain ID: {domain_info['id']}")  # Full OCID
         if 'url' in domain_info:
             print(f"Domain URL: {domain_info['url']}")
@@ -267,34 +643,21 @@ def print_detailed_domain_info(domains_info, show_users=True, filter_username=No
             print(f"\nUSERS IN {domain_info['name']}:")
             print("-" * 80)
             
-            # Prepare user table data
-            user_data = []
-            for user in domain_info['users']:
-                if domain_info['type'] == 'Legacy IAM':
-                    user_data.append([
-                        user['username'],
-                        user['email'],
-                        user['status'],
-                        user['created'],
-                        user['user_id']
-                    ])
-                else:
-                    user_data.append([
-                        user['username'],
-                        user.get('display_name', 'N/A'),
-                        user['email'],
-                        user['status'],
-                        user['created'],
-                        user['user_id']
-                    ])
-            
-            # Different headers for different domain types
+            # Different columns for different domain types
             if domain_info['type'] == 'Legacy IAM':
                 headers = ['Username', 'Email', 'Status', 'Created', 'User OCID']
+                user_data = [
+                    [user.username, user.email, user.status, user.created, user.user_id]
+                    for user in domain_info['users']
+                ]
             else:
                 headers = ['Username', 'Display Name', 'Email', 'Status', 'Created', 'User ID']
+                user_data = [
+                    [user.username, user.display_name, user.email, user.status, user.created, user.user_id]
+                    for user in domain_info['users']
+                ]
             
-            print(tabulate(user_data, headers=headers, tablefmt='grid'))
+            print_table(user_data, headers, table_format)
         elif show_users:
             print(f"\nNo users found in {domain_info['name']}")
     
@@ -302,141 +665,168 @@ def print_detailed_domain_info(domains_info, show_users=True, filter_username=No
         print(f"\nNo domains contain users matching '{filter_username}'")
 
 
-def main():
-    parser = argparse.ArgumentParser(description='List all OCI domains and their users')
-    parser.add_argument('--profile', default='DEFAULT', help='OCI config profile to use')
-    parser.add_argument('--summary-only', action='store_true', help='Show only domain summary, not individual users')
-    parser.add_argument('--export-csv', help='Export results to CSV file')
-    parser.add_argument('--username', help='Filter results to show only users matching this username (partial match)')
-    
-    args = parser.parse_args()
+def scan_tenancy(args):
+    """Connect to the tenancy and collect legacy IAM and identity domain users, from the cache when it is fresh"""
+    load_dependencies()
     
     # Load OCI configuration
     config = get_oci_config(args.profile)
     
     # Initialize Identity client
+    signer = None
     try:
-        identity_client = oci.identity.IdentityClient(config)
+        identity_client = oci.identity.IdentityClient(config, retry_strategy=build_retry_strategy())
+        # Share the signer the SDK derived from the config (including any authentication_type)
+        # with every domain client, so the private key is only loaded once
+        signer = identity_client.base_client.signer
     except Exception as e:
-        print(f"Error creating identity client: {e}")
-        print("Trying with instance principal for Cloud Shell...")
+        logger.warning("Error creating identity client: %s", e)
+        logger.info("Trying with instance principal for Cloud Shell...")
         try:
             # For Cloud Shell - use instance principal
             config = {}
-            identity_client = oci.identity.IdentityClient(config, signer=oci.auth.signers.InstancePrincipalsSecurityTokenSigner())
+            signer = oci.auth.signers.InstancePrincipalsSecurityTokenSigner()
+            identity_client = oci.identity.IdentityClient(config, signer=signer, retry_strategy=build_retry_strategy())
         except Exception as e2:
-            print(f"Error with instance principal: {e2}")
+            logger.error("Error with instance principal: %s", e2)
             sys.exit(1)
     
-    # Get tenancy OCID
-    try:
-        tenancy_response = identity_client.get_tenancy(identity_client.base_client.config['tenancy'] if 'tenancy' in identity_client.base_client.config else identity_client.list_compartments(identity_client.base_client.config.get('tenancy', 'ocid1.tenancy')))
-        tenancy_id = identity_client.base_client.config.get('tenancy') or 'AUTO_DETECT'
-    except:
-        # Fallback - try to get from environment or use a basic call
+    # Get tenancy OCID - validated config files always carry it, instance principals know their own
+    tenancy_id = config.get('tenancy') or getattr(signer, 'tenancy_id', None)
+    if not tenancy_id:
+        logger.error("Could not determine tenancy OCID")
+        sys.exit(1)
+    
+    logger.info("Scanning OCI Tenancy for Domains and Users...")
+    if args.username:
+        logger.info("Filtering by username: '%s'", args.username)
+    logger.info("Tenancy ID: %s", tenancy_id)
+    logger.info("Profile: %s", args.profile)
+    
+    # Stream users to the CSV export as they are fetched instead of holding them all
+    csv_file = csv_writer = None
+    if args.export_csv:
         try:
-            tenancy_info = identity_client.get_tenancy()
-            tenancy_id = tenancy_info.data.id
-        except:
-            print("Could not determine tenancy OCID")
+            csv_file, csv_writer = open_csv_export(args.export_csv, args.username)
+        except Exception as e:
+            logger.error("Error exporting to CSV: %s", e)
             sys.exit(1)
+    # Individual users are only needed in memory for the detailed report
+    keep_users = not args.summary_only
     
-    print(f"Scanning OCI Tenancy for Domains and Users...")
-    if args.username:
-        print(f"Filtering by username: '{args.username}'")
-    print(f"Tenancy ID: {tenancy_id}")
-    print(f"Profile: {args.profile}")
-    print(f"Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    
-    domains_info = []
-    
-    # Get legacy users from root tenancy
-    print(f"\nScanning Legacy IAM (Root Tenancy)...")
-    legacy_users = get_legacy_users(identity_client, tenancy_id, args.username)
-    domains_info.append({
-        'name': 'Root Tenancy (Legacy IAM)',
-        'type': 'Legacy IAM',
-        'id': tenancy_id,
-        'status': 'Active',
-        'users': legacy_users
-    })
+    # Streaming the CSV without keeping users in memory leaves nothing to cache, and first-match scans are partial
+    cache_path = None
+    if not (args.no_cache or args.first_match) and args.cache_ttl > 0 and (keep_users or not csv_writer):
+        cache_path = scan_cache_path(tenancy_id, args.profile, args.username, keep_users)
+    domains_info = load_cached_scan(cache_path, args.cache_ttl) if cache_path else None
     
-    if args.username:
-        print(f"Found {len(legacy_users)} matching legacy users")
+    if domains_info is not None:
+        # A warning so --quiet still shows the report may be up to cache_ttl seconds stale
+        logger.warning("Using cached scan results up to %d seconds old; pass --no-cache for live data",
+                       args.cache_ttl)
+        if csv_writer:
+            for domain_info in domains_info:
+                for user in domain_info['users']:
+                    csv_writer.writerow(csv_row(domain_info, user))
     else:
-        print(f"Found {len(legacy_users)} legacy users")
+        domains_info = []
+        
+        # Get legacy users from root tenancy
+        logger.info("Scanning Legacy IAM (Root Tenancy)...")
+        legacy_info = {
+            'name': 'Root Tenancy (Legacy IAM)',
+            'type': 'Legacy IAM',
+            'id': tenancy_id,
+            'status': 'Active',
+            'users': [],
+            'user_count': 0
+        }
+        legacy_info['complete'] = get_legacy_users(identity_client, tenancy_id,
+                                                   make_user_collector(legacy_info, csv_writer, keep_users),
+                                                   args.username)
+        domains_info.append(legacy_info)
     
-    # Get all identity domains
-    print(f"\nScanning Identity Domains...")
-    domains = get_all_domains(identity_client, tenancy_id)
+        if args.username:
+            logger.info("Found %d matching legacy users", legacy_info['user_count'])
+        else:
+            logger.info("Found %d legacy users", legacy_info['user_count'])
     
-    if domains:
-        print(f"Found {len(domains)} identity domain(s)")
-        
-        for domain in domains:
-            print(f"\nProcessing domain: {domain.display_name}")
+        # Get all identity domains
+        domains = None
+        if args.first_match and legacy_info['user_count']:
+            logger.warning("Match found in legacy IAM; identity domains were not scanned, results are partial")
+        else:
+            logger.info("Scanning Identity Domains...")
+            domains = get_all_domains(identity_client, tenancy_id)
             
-            # Create Identity Domains client
-            domain_client = create_identity_domains_client(config, domain.url)
-            if domain_client:
-                users = get_identity_domain_users(domain_client, args.username)
-                if args.username:
-                    print(f"Found {len(users)} matching users in {domain.display_name}")
-                else:
-                    print(f"Found {len(users)} users in {domain.display_name}")
+            if domains:
+                logger.info("Found %d identity domain(s)", len(domains))
+                domains_info.extend(asyncio.run(scan_identity_domains(config, signer, domains, args.username,
+                                                                      args.max_rate, csv_writer, keep_users,
+                                                                      args.first_match)))
             else:
-                users = []
-                print(f"Could not access {domain.display_name}")
-            
-            domains_info.append({
-                'name': domain.display_name,
-                'type': 'Identity Domain',
-                'id': domain.id,  # Full OCID
-                'url': domain.url,
-                'status': domain.lifecycle_state,
-                'users': users
-            })
-            
-            # Small delay between domains
-            time.sleep(0.5)
-    else:
-        print("No identity domains found or no access to list domains")
+                logger.warning("No identity domains found or no access to list domains")
+        
+        # Errors are logged and reported as empty results, so only cache a scan where nothing failed
+        if cache_path and domains is not None and all(domain_info['complete'] for domain_info in domains_info):
+            save_cached_scan(cache_path, domains_info)
+    
+    # Finish the CSV export, which was written while scanning
+    if csv_file:
+        try:
+            csv_writer.flush()
+            csv_file.close()
+            logger.info("Results exported to: %s", args.export_csv)
+        except Exception as e:
+            logger.error("Error exporting to CSV: %s", e)
+    
+    return domains_info
+
+
+def main():
+    parser = argparse.ArgumentParser(description='List all OCI domains and their users')
+    parser.add_argument('--profile', default='DEFAULT', help='OCI config profile to use')
+    parser.add_argument('--summary-only', action='store_true', help='Show only domain summary, not individual users')
+    parser.add_argument('--export-csv', help='Export results to CSV file')
+    parser.add_argument('--username',
+                        help='Filter results to show only users matching this username (partial match); '
+                             'separate several usernames with commas')
+    parser.add_argument('--table-format', default=DEFAULT_TABLE_FORMAT,
+                        help=f'tabulate table format, e.g. simple, plain or grid (default: {DEFAULT_TABLE_FORMAT})')
+    parser.add_argument('--first-match', action='store_true',
+                        help='Stop scanning once a domain has users matching --username (results may be partial)')
+    parser.add_argument('--max-rate', type=float, default=DEFAULT_MAX_RATE,
+                        help=f'Maximum identity domain API requests per second (default: {DEFAULT_MAX_RATE})')
+    parser.add_argument('--no-cache', action='store_true', help='Ignore and do not write the on-disk scan cache')
+    parser.add_argument('--cache-ttl', type=int, default=DEFAULT_CACHE_TTL,
+                        help=f'Seconds a cached scan remains valid (default: {DEFAULT_CACHE_TTL})')
+    parser.add_argument('--quiet', action='store_true', help='Only log warnings and errors while scanning')
+    
+    args = parser.parse_args()
+    if args.username is not None and not split_usernames(args.username):
+        parser.error('--username must contain at least one name')
+    if args.first_match and not args.username:
+        parser.error('--first-match requires --username')
+    if not args.max_rate > 0:  # Also rejects nan
+        parser.error('--max-rate must be greater than 0')
+    
+    # Progress goes to stderr through the queued logger; the report below is all that reaches stdout
+    listener = start_log_listener(logging.WARNING if args.quiet else logging.INFO)
+    try:
+        domains_info = scan_tenancy(args)
+    finally:
+        # Flush queued progress messages before the report is printed
+        listener.stop()
+    
+    # Counted once here and shared by the report helpers
+    total_users = sum(domain_info['user_count'] for domain_info in domains_info)
     
     # Print results
-    print_domain_summary(domains_info, args.username)
+    print_domain_summary(domains_info, args.username, args.table_format, total_users=total_users)
     
     if not args.summary_only:
-        print_detailed_domain_info(domains_info, show_users=True, filter_username=args.username)
-    
-    # Export to CSV if requested
-    if args.export_csv:
-        try:
-            import csv
-            with open(args.export_csv, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.writer(csvfile)
-                if args.username:
-                    writer.writerow(['# Filtered results for username:', args.username])
-                    writer.writerow([])  # Empty row
-                
-                writer.writerow(['Domain Name', 'Domain Type', 'Domain ID', 'Username', 'Display Name', 'Email', 'Status', 'Created', 'User ID'])
-                
-                for domain_info in domains_info:
-                    for user in domain_info['users']:
-                        writer.writerow([
-                            domain_info['name'],
-                            domain_info['type'],
-                            domain_info['id'],  # Full OCID
-                            user['username'],
-                            user.get('display_name', 'N/A'),
-                            user['email'],
-                            user['status'],
-                            user['created'],
-                            user['user_id']  # Full OCID/ID
-                        ])
-            
-            print(f"\nResults exported to: {args.export_csv}")
-        except Exception as e:
-            print(f"Error exporting to CSV: {e}")
+        print_detailed_domain_info(domains_info, show_users=True, filter_username=args.username,
+                                   table_format=args.table_format)
 
 
 if __name__ == "__main__":